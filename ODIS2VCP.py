@@ -14,12 +14,35 @@ Autor: Pavel Kloc
 import xml.etree.ElementTree as ET
 import argparse
 import binascii
+import io
 import os
-import re
 import sys
-import crcmod
+import zlib
 import logging
-from typing import List, Optional, Dict, Tuple, BinaryIO, TextIO, Any
+from xml.sax.saxutils import escape
+from typing import List, Optional, Dict, Tuple, BinaryIO, TextIO, Any, Iterator, Union, Callable
+
+# Volitelné použití lxml (rychlejší parser v C), jinak standardní ElementTree
+try:
+    from lxml import etree as LET
+except ImportError:
+    LET = None
+
+# Volitelné použití rychlých CRC knihoven (folding/PCLMULQDQ, slice-by-16)
+try:
+    import anycrc
+except ImportError:
+    anycrc = None
+
+try:
+    import fastcrc
+except ImportError:
+    fastcrc = None
+
+if LET is not None:
+    XML_PARSE_ERRORS: Tuple[type, ...] = (ET.ParseError, LET.XMLSyntaxError)
+else:
+    XML_PARSE_ERRORS = (ET.ParseError,)
 
 # Nastavení logování
 logging.basicConfig(
@@ -29,30 +52,81 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Konstanty
+# Parametry CRC-32/ISO-HDLC (reflektovaný, shodný s zlib.crc32)
 CRC32_POLYNOMIAL = 0x104c11db7
 CRC32_INIT_VALUE = 0
 CRC32_XOR_OUT = 0xFFFFFFFF
 
+# Velikost bufferu výstupního XML souboru (velké bloky = méně systémových volání)
+OUTPUT_BUFFER_SIZE = 1 << 20
+
+# Velikost bloku pro postupné čtení modifikovaných dat a výpočet CRC
+CRC_CHUNK_SIZE = 64 * 1024
+
+# Velikost bloku dat pro postupný zápis hexadecimálního výstupu
+HEX_CHUNK_SIZE = 64 * 1024
+
+# Znaky odstraňované z hexadecimálního řetězce (bílé znaky a čárky)
+HEX_STRIP_TABLE = str.maketrans('', '', ' \t\n\r\v\f,')
+
+
+def _zlib_crc32(data: bytes, crc: int = 0) -> int:
+    """Výpočet CRC-32/ISO-HDLC pomocí nativní implementace v zlib (lze navazovat po blocích)."""
+    return zlib.crc32(data, crc) & 0xFFFFFFFF
+
+
+def _select_crc32_func() -> Callable[[bytes, int], int]:
+    """
+    Výběr nejrychlejší dostupné implementace CRC-32/ISO-HDLC.
+    
+    Všechny varianty přijímají předchozí hodnotu CRC pro navazující výpočet.
+    
+    Returns:
+        Funkce (data, crc) -> CRC
+    """
+    if anycrc is not None:
+        return anycrc.Model('CRC32-ISO-HDLC').calc
+    if fastcrc is not None:
+        return fastcrc.crc32.iso_hdlc
+    return _zlib_crc32
+
+
+# Funkce pro výpočet CRC32 se vybírá jednou při importu modulu
+_CRC32_FUNC: Callable[[bytes, int], int] = _select_crc32_func()
+
 
 class DatasetODIS:
     """
     Třída reprezentující dataset z ODIS formátu.
     """
-    def __init__(self, data: bytes, address: int, start_address: int) -> None:
+    def __init__(
+        self,
+        data: bytes,
+        address: int,
+        start_address: int,
+        name: Optional[str] = None,
+        version: Optional[str] = None,
+        login: Optional[str] = None
+    ) -> None:
         """
         Inicializace datasetu ODIS.
         
+        Data se ukládají jako bytearray, aby bylo možné CRC přepsat na místě.
+        
         Args:
             data: Binární data datasetu
             address: Diagnostická adresa
             start_address: Počáteční adresa
+            name: Název datasetu (ZDC_NAME)
+            version: Verze datasetu (ZDC_VERSION)
+            login: Přihlašovací kód (LOGIN)
         """
-        self.data = data
+        self.data: bytearray = data if isinstance(data, bytearray) else bytearray(data)
         self.address = address
         self.start_address = start_address
-        self.name: Optional[str] = None
-        self.version: Optional[str] = None
-        self.login: Optional[str] = None
+        self.name = name
+        self.version = version
+        self.login = login
     
     def __str__(self) -> str:
         """Textová reprezentace datasetu pro ladění."""
@@ -63,20 +137,42 @@ class ConversionResult:
     """
     Třída obsahující výsledek konverze z ODIS do VCP.
     """
-    def __init__(self, dataset: DatasetODIS, vcp: str) -> None:
+    def __init__(self, dataset: DatasetODIS, vcp_header: str, vcp_footer: str) -> None:
         """
         Inicializace výsledku konverze.
         
+        Hexadecimální obsah elementu DATEN se neukládá, generuje se až při
+        zápisu z dat datasetu, aby se velký řetězec nedržel v paměti.
+        
         Args:
             dataset: Původní dataset ODIS
-            vcp: Výsledný VCP XML řetězec
+            vcp_header: Část VCP XML před obsahem elementu DATEN
+            vcp_footer: Část VCP XML za obsahem elementu DATEN
         """
         self.dataset = dataset
-        self.vcp = vcp
+        self.vcp_header = vcp_header
+        self.vcp_footer = vcp_footer
     
+    @property
+    def vcp(self) -> str:
+        """Kompletní VCP XML řetězec (sestavený v paměti)."""
+        return self.vcp_header + format_hex_data(self.dataset.data) + self.vcp_footer
+
+    def write_vcp(self, output: TextIO) -> None:
+        """
+        Zápis VCP XML do výstupu bez sestavení celého řetězce v paměti.
+        
+        Args:
+            output: Textový výstupní soubor
+        """
+        output.write(self.vcp_header)
+        write_hex_data(output, self.dataset.data)
+        output.write(self.vcp_footer)
+
     def __str__(self) -> str:
         """Textová reprezentace výsledku konverze pro ladění."""
-        return f"ConversionResult(dataset={self.dataset}, vcp_size={len(self.vcp)})"
+        vcp_size = len(self.vcp_header) + len(self.vcp_footer) + max(5 * len(self.dataset.data) - 1, 0)
+        return f"ConversionResult(dataset={self.dataset}, vcp_size={vcp_size})"
 
 
 def parse_arguments() -> argparse.Namespace:
@@ -93,7 +189,7 @@ def parse_arguments() -> argparse.Namespace:
     parser.add_argument(
         'input', 
         metavar='<input>', 
-        type=argparse.FileType('r'), 
+        type=argparse.FileType('rb'), 
         help='ODIS XML soubor'
     )
     parser.add_argument(
@@ -117,56 +213,88 @@ def parse_arguments() -> argparse.Namespace:
     return parser.parse_args()
 
 
-def parse_odis_file(xml_content: str) -> List[DatasetODIS]:
+def iter_parameter_data(source: BinaryIO) -> Iterator[Any]:
+    """
+    Postupné (streamované) procházení elementů PARAMETER_DATA.
+    
+    Každý element je po zpracování uvolněn z paměti, takže i velké
+    ODIS soubory se nemusí načítat celé do stromu.
+    
+    Args:
+        source: Binární souborový objekt s XML obsahem
+    
+    Yields:
+        Elementy PARAMETER_DATA
+    """
+    if LET is not None:
+        # huge_tree: jinak lxml odmítá textové uzly nad 10 MB (datasety od cca 2 MB)
+        for _, param in LET.iterparse(source, events=('end',), tag='PARAMETER_DATA', huge_tree=True):
+            yield param
+            # Uvolnění zpracovaného elementu a jeho předchozích sourozenců
+            param.clear()
+            while param.getprevious() is not None:
+                del param.getparent()[0]
+    else:
+        for _, param in ET.iterparse(source, events=('end',)):
+            if param.tag == 'PARAMETER_DATA':
+                yield param
+                param.clear()
+
+
+def parse_odis_file(xml_content: Union[str, bytes, BinaryIO]) -> List[DatasetODIS]:
     """
     Parsování XML souboru formátu ODIS.
     
     Args:
-        xml_content: Obsah XML souboru
+        xml_content: Obsah XML souboru nebo binární souborový objekt
     
     Returns:
         Seznam datasetů ODIS
     
     Raises:
-        ET.ParseError: Pokud XML není validní
+        ET.ParseError: Pokud XML není validní (případně lxml.etree.XMLSyntaxError)
     """
+    datasets: List[DatasetODIS] = []
+
     try:
-        tree = ET.fromstring(xml_content)
-    except ET.ParseError as e:
+        if isinstance(xml_content, str):
+            # Již dekódovaný řetězec: deklarace kódování v XML se musí ignorovat
+            params: Iterator[Any] = ET.fromstring(xml_content).iter('PARAMETER_DATA')
+        else:
+            if isinstance(xml_content, bytes):
+                xml_content = io.BytesIO(xml_content)
+            params = iter_parameter_data(xml_content)
+
+        for param in params:
+            try:
+                # Získání atributů s defaultními hodnotami pro případ chybějících dat
+                attrs = param.attrib
+                
+                dataset = DatasetODIS(
+                    data=convert_to_binary(param.text),
+                    address=int(attrs.get('DIAGNOSTIC_ADDRESS', '0'), 16),
+                    start_address=int(attrs.get('START_ADDRESS', '0'), 16),
+                    name=attrs.get('ZDC_NAME'),
+                    version=attrs.get('ZDC_VERSION'),
+                    login=attrs.get('LOGIN')
+                )
+
+                datasets.append(dataset)
+                logger.debug(f"Parsován dataset: {dataset}")
+            except (ValueError, TypeError, binascii.Error) as e:
+                logger.warning(f"Chyba při zpracování datasetu: {e}")
+                # Pokračujeme s dalšími datasety
+    except XML_PARSE_ERRORS as e:
         logger.error(f"Chyba při parsování XML: {e}")
         raise
 
-    datasets: List[DatasetODIS] = []
-
-    for param in tree.iter('PARAMETER_DATA'):
-        try:
-            # Získání atributů s defaultními hodnotami pro případ chybějících dat
-            diag_addr_str = param.get('DIAGNOSTIC_ADDRESS', '0')
-            start_addr_str = param.get('START_ADDRESS', '0')
-            
-            dataset = DatasetODIS(
-                data=convert_to_binary(param.text),
-                address=int(diag_addr_str, 16),
-                start_address=int(start_addr_str, 16)
-            )
-
-            dataset.name = param.get('ZDC_NAME')
-            dataset.version = param.get('ZDC_VERSION')
-            dataset.login = param.get('LOGIN')
-
-            datasets.append(dataset)
-            logger.debug(f"Parsován dataset: {dataset}")
-        except (ValueError, TypeError, binascii.Error) as e:
-            logger.warning(f"Chyba při zpracování datasetu: {e}")
-            # Pokračujeme s dalšími datasety
-
     if not datasets:
         logger.warning("Nebyly nalezeny žádné datasety v ODIS souboru")
         
     return datasets
 
 
-def convert_to_binary(hex_string: Optional[str]) -> bytes:
+def convert_to_binary(hex_string: Optional[str]) -> bytearray:
     """
     Převod hexadecimálního řetězce na binární data.
     
@@ -177,20 +305,65 @@ def convert_to_binary(hex_string: Optional[str]) -> bytes:
         Binární data
     """
     if hex_string is None:
-        return bytes()
+        return bytearray()
 
-    # Odstranění 0x, mezer a čárek
-    clean_string = hex_string.replace('0x', '')
-    clean_string = re.sub(r'\s', '', clean_string)
-    clean_string = clean_string.replace(',', '')
+    # Odstranění 0x, mezer a čárek (replace a translate běží v C bez regex enginu)
+    clean_string = hex_string.replace('0x', '').translate(HEX_STRIP_TABLE)
     
     try:
-        return binascii.unhexlify(clean_string)
-    except binascii.Error as e:
+        return bytearray.fromhex(clean_string)
+    except ValueError:
+        # Tabulka odstraňuje jen ASCII bílé znaky, zkusíme i ostatní Unicode (např. \xa0)
+        clean_string = ''.join(clean_string.split())
+
+    try:
+        return bytearray.fromhex(clean_string)
+    except ValueError as e:
         logger.error(f"Chyba při převodu hex na bin: {e}")
         raise
 
 
+def format_hex_data(data: bytes) -> str:
+    """
+    Převod binárních dat na hexadecimální řetězec ve formátu VCP.
+    
+    Args:
+        data: Binární data
+    
+    Returns:
+        Řetězec ve tvaru "0x01,0x02,..."
+    """
+    if not data:
+        return ''
+
+    # Hex číslice z bytes.hex se po krocích vloží do předpřipravené
+    # šablony "0x00," (slice s krokem běží v C, bez smyčky přes byty)
+    raw = data.hex().encode('ascii')
+    out = bytearray(b'0x00,') * len(data)
+    out[2::5] = raw[0::2]
+    out[3::5] = raw[1::2]
+    del out[-1]
+    return out.decode('ascii')
+
+
+def write_hex_data(output: TextIO, data: bytes, chunk_size: int = HEX_CHUNK_SIZE) -> None:
+    """
+    Postupný zápis binárních dat v hexadecimálním formátu VCP.
+    
+    Data se převádějí po blocích, takže v paměti není celý hexadecimální řetězec.
+    
+    Args:
+        output: Textový výstupní soubor
+        data: Binární data
+        chunk_size: Velikost bloku v bytech
+    """
+    view = memoryview(data)
+    for offset in range(0, len(view), chunk_size):
+        if offset:
+            output.write(',')
+        output.write(format_hex_data(view[offset:offset + chunk_size]))
+
+
 def update_crc(dataset: DatasetODIS, new_data: bytes) -> int:
     """
     Aktualizace dat v datasetu včetně přepočítání CRC.
@@ -202,23 +375,58 @@ def update_crc(dataset: DatasetODIS, new_data: bytes) -> int:
     Returns:
         Nová hodnota CRC
     """
-    # Vytvoření funkce pro výpočet CRC32
-    crc32_func = crcmod.mkCrcFun(
-        CRC32_POLYNOMIAL, 
-        initCrc=CRC32_INIT_VALUE, 
-        xorOut=CRC32_XOR_OUT
-    )
-    
     # Nahrazení dat v datasetu
-    dataset.data = new_data
+    dataset.data = bytearray(new_data)
+    
+    # Výpočet CRC (bez posledních 4 byte) nad memoryview bez kopírování dat
+    new_crc = _CRC32_FUNC(memoryview(dataset.data)[:-4], 0)
+    
+    # Přepsání posledních 4 byte novou CRC přímo v bufferu
+    dataset.data[-4:] = new_crc.to_bytes(4, byteorder='little')
+    
+    return new_crc
+
+
+def update_crc_stream(
+    dataset: DatasetODIS,
+    mod_file: BinaryIO,
+    chunk_size: int = CRC_CHUNK_SIZE
+) -> int:
+    """
+    Aktualizace dat v datasetu ze souboru včetně přepočítání CRC.
     
-    # Výpočet a aktualizace CRC (posledních 4 byte)
-    base_data = dataset.data[:-4]
-    new_crc = crc32_func(base_data)
+    Soubor se čte po blocích a CRC se počítá průběžně, posledních 4 byte
+    (původní CRC) se do výpočtu nezahrnuje. Data se skládají do jediného
+    bufferu, do kterého se nová CRC zapíše na místě.
     
-    # Aktualizace dat s novou CRC
-    dataset.data = base_data + new_crc.to_bytes(4, byteorder='little')
+    Args:
+        dataset: Dataset k aktualizaci
+        mod_file: Binární soubor s novými daty
+        chunk_size: Velikost čteného bloku v bytech
     
+    Returns:
+        Nová hodnota CRC
+    """
+    data = bytearray()
+    new_crc = 0
+    hashed = 0
+
+    while True:
+        chunk = mod_file.read(chunk_size)
+        if not chunk:
+            break
+        data += chunk
+
+        # Průběžný výpočet CRC, posledních 4 byte zatím vynecháme
+        end = len(data) - 4
+        if end > hashed:
+            new_crc = _CRC32_FUNC(memoryview(data)[hashed:end], new_crc)
+            hashed = end
+
+    # Přepsání posledních 4 byte novou CRC
+    data[-4:] = new_crc.to_bytes(4, byteorder='little')
+    dataset.data = data
+
     return new_crc
 
 
@@ -233,6 +441,9 @@ def convert_to_vcp(datasets: List[DatasetODIS], input_name: str) -> List[Convers
     Returns:
         Seznam výsledků konverze
     """
+    # Konverze sestavuje jen krátkou hlavičku a patičku XML, hexadecimální
+    # data se generují až při zápisu. Paralelní zpracování v procesech by
+    # jen přenášelo data datasetů mezi procesy, proto probíhá sekvenčně.
     return [convert_dataset_to_vcp(dataset, input_name) for dataset in datasets]
 
 
@@ -247,41 +458,29 @@ def convert_dataset_to_vcp(dataset: DatasetODIS, input_name: str) -> ConversionR
     Returns:
         Výsledek konverze
     """
-    # Vytvoření kořenového elementu
-    root = ET.Element('SW-CNT')
-
-    # Identifikační sekce
-    ident = ET.SubElement(root, 'IDENT')
-
     # Použití jména datasetu nebo vygenerování jména z názvu souboru a adresy
-    name = dataset.name or f'{input_name}-{dataset.address:x}'
-
-    # Přidání identifikačních údajů
-    ET.SubElement(ident, 'LOGIN').text = dataset.login or ''
-    ET.SubElement(ident, 'DATAIID').text = name
-    ET.SubElement(ident, 'VERSION-INHALT').text = dataset.version or ''
-
-    # Sekce s daty
-    datasets_section = ET.SubElement(root, 'DATENBEREICHE')
-    data_section = ET.SubElement(datasets_section, 'DATENBEREICH')
-
-    # Přidání informací o datech
-    ET.SubElement(data_section, 'DATEN-NAME').text = name
-    ET.SubElement(data_section, 'DATEN-FORMAT_NAME').text = 'DFN_HEX'
-    ET.SubElement(data_section, 'START-ADR').text = f"0x{dataset.start_address:x}"
-
-    # Velikost dat
-    size = len(dataset.data)
-    ET.SubElement(data_section, 'GROESSE-DEKOMPRIMIERT').text = f"0x{size:x}"
-    
-    # Převod binárních dat do hexadecimální reprezentace oddělené čárkami
-    hex_data = ','.join([f"0x{b:02x}" for b in dataset.data])
-    ET.SubElement(data_section, 'DATEN').text = hex_data
-
-    # Převod na řetězec
-    vcp_xml = ET.tostring(root, encoding="unicode")
+    name = escape(dataset.name or f'{input_name}-{dataset.address:x}')
+
+    # Pevná struktura VCP se skládá přímo šablonou, bez stavby stromu elementů.
+    # Hexadecimální obsah elementu DATEN se zapisuje až při exportu.
+    header = (
+        f'<SW-CNT>'
+        f'<IDENT>'
+        f'<LOGIN>{escape(dataset.login or "")}</LOGIN>'
+        f'<DATAIID>{name}</DATAIID>'
+        f'<VERSION-INHALT>{escape(dataset.version or "")}</VERSION-INHALT>'
+        f'</IDENT>'
+        f'<DATENBEREICHE>'
+        f'<DATENBEREICH>'
+        f'<DATEN-NAME>{name}</DATEN-NAME>'
+        f'<DATEN-FORMAT_NAME>DFN_HEX</DATEN-FORMAT_NAME>'
+        f'<START-ADR>0x{dataset.start_address:x}</START-ADR>'
+        f'<GROESSE-DEKOMPRIMIERT>0x{len(dataset.data):x}</GROESSE-DEKOMPRIMIERT>'
+        f'<DATEN>'
+    )
+    footer = '</DATEN></DATENBEREICH></DATENBEREICHE></SW-CNT>'
     
-    return ConversionResult(dataset, vcp_xml)
+    return ConversionResult(dataset, header, footer)
 
 
 def export_output(
@@ -307,10 +506,14 @@ def export_output(
         if args.raw:
             # Export RAW binárního formátu
             output_filename = f'RAW_{input_name}.bin'
-            output = args.output or open(output_filename, 'wb')
+            # Nebufferovaný zápis, data jdou přímo do souboru bez mezikopie
+            output = args.output or open(output_filename, 'wb', buffering=0)
             
             with output:
-                output.write(converted[0].dataset.data)
+                # Nebufferovaný zápis může zapsat jen část dat
+                view = memoryview(converted[0].dataset.data)
+                while view:
+                    view = view[output.write(view):]
                 
             logger.info(f"Exportován RAW binární soubor: {output_filename}")
             
@@ -318,10 +521,10 @@ def export_output(
             # Export modifikovaného VCP
             modinput_name = os.path.splitext(os.path.basename(args.modinput.name))[0]
             output_filename = f'VCP_mod_{input_name}_by_{modinput_name}.xml'
-            output = args.output or open(output_filename, 'w')
+            output = args.output or open(output_filename, 'w', buffering=OUTPUT_BUFFER_SIZE)
             
             with output:
-                output.write(converted[0].vcp)
+                converted[0].write_vcp(output)
                 
             if new_crc:
                 logger.info(f"Exportován modifikovaný VCP XML soubor: {output_filename}, aktualizovaný CRC: 0x{new_crc:08x}")
@@ -331,10 +534,10 @@ def export_output(
         else:
             # Export standardního VCP
             output_filename = f'VCP_converted_{input_name}.xml'
-            output = args.output or open(output_filename, 'w')
+            output = args.output or open(output_filename, 'w', buffering=OUTPUT_BUFFER_SIZE)
             
             with output:
-                output.write(converted[0].vcp)
+                converted[0].write_vcp(output)
                 
             logger.info(f"Exportován VCP XML soubor: {output_filename}")
             
@@ -354,11 +557,10 @@ def main() -> None:
         # Výpis ladících informací
         logger.info(f"Zpracovávám soubor: {args.input.name}")
         
-        # Načtení a parsování ODIS souboru
+        # Načtení a parsování ODIS souboru (parser čte přímo z binárního souboru)
         with args.input:
-            xml_content = args.input.read()
+            datasets = parse_odis_file(args.input)
         
-        datasets = parse_odis_file(xml_content)
         if not datasets:
             logger.error("Nebyly nalezeny žádné datasety, ukončuji")
             return
@@ -369,15 +571,17 @@ def main() -> None:
         # Modifikace dat, pokud je zadán --modinput
         new_crc = None
         if args.modinput and datasets:
+            logger.info(f"Modifikuji data z: {args.modinput.name}")
             with args.modinput:
-                new_data = args.modinput.read()
+                new_crc = update_crc_stream(datasets[0], args.modinput)
                 
-            logger.info(f"Modifikuji data z: {args.modinput.name}")
-            new_crc = update_crc(datasets[0], new_data)
             logger.info(f"Nová CRC: 0x{new_crc:08x}")
         
-        # Konverze na VCP formát
-        converted = convert_to_vcp(datasets, input_name)
+        # Konverze na VCP formát (pro RAW výstup se XML nesestavuje)
+        if args.raw:
+            converted = [ConversionResult(dataset, '', '') for dataset in datasets]
+        else:
+            converted = convert_to_vcp(datasets, input_name)
         
         # Export výsledku
         export_output(converted, args, input_name, new_crc)
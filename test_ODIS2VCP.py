@@ -0,0 +1,46 @@
+"""
+Regresní testy pro ODIS2VCP.
+"""
+
+import io
+import os
+
+import pytest
+
+import ODIS2VCP
+
+
+def make_odis_xml(data: bytes) -> bytes:
+    """Sestavení ODIS XML s jedním datasetem."""
+    hex_data = ','.join(f'0x{b:02x}' for b in data)
+    return (
+        '<ROOT><PARAMETER_DATA DIAGNOSTIC_ADDRESS="0x17" START_ADDRESS="0x0">'
+        f'{hex_data}'
+        '</PARAMETER_DATA></ROOT>'
+    ).encode('ascii')
+
+
+@pytest.mark.parametrize('use_lxml', [True, False])
+def test_parse_large_dataset(monkeypatch, use_lxml):
+    """Dataset o 3 MB (15 MB hex textu) musí projít oběma parsery."""
+    if use_lxml and ODIS2VCP.LET is None:
+        pytest.skip('lxml není nainstalováno')
+    if not use_lxml:
+        monkeypatch.setattr(ODIS2VCP, 'LET', None)
+
+    data = os.urandom(3 * 1024 * 1024)
+    datasets = ODIS2VCP.parse_odis_file(io.BytesIO(make_odis_xml(data)))
+
+    assert len(datasets) == 1
+    assert datasets[0].data == data
+
+
+def test_convert_to_binary_unicode_whitespace():
+    """Unicode bílé znaky mezi byty se odstraňují stejně jako ASCII."""
+    assert ODIS2VCP.convert_to_binary('0x01\xa00x02\x850x03\x1c0x04') == b'\x01\x02\x03\x04'
+
+
+def test_convert_to_binary_invalid():
+    """Nehexadecimální znaky vyvolají ValueError."""
+    with pytest.raises(ValueError):
+        ODIS2VCP.convert_to_binary('0x01,0xzz')